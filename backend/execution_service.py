@@ -0,0 +1,510 @@
+"""
+Process-pool execution of user analysis code
+Keeps long-running statistics off the API event loop and out of the API process
+"""
+
+import os
+import ast
+import asyncio
+import io
+import base64
+import json
+import signal
+import importlib
+import threading
+import logging
+import warnings
+import multiprocessing as mp
+from collections import OrderedDict
+from functools import lru_cache
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from datetime import date, datetime, time
+from types import CodeType
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib._pylab_helpers import Gcf
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# PyArrow parses CSVs with multiple threads; fall back to pandas' C engine without it
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+warnings.filterwarnings('ignore')
+
+logger = logging.getLogger(__name__)
+
+EXECUTION_WORKERS = int(os.environ.get('EXECUTION_WORKERS', min(4, os.cpu_count() or 1)))
+EXECUTION_CPU_LIMIT_SECONDS = int(os.environ.get('EXECUTION_CPU_LIMIT_SECONDS', 120))
+EXECUTION_MEMORY_LIMIT_MB = int(os.environ.get('EXECUTION_MEMORY_LIMIT_MB', 0))  # 0 = unlimited
+EXECUTION_OUTPUT_LIMIT_CHARS = int(os.environ.get('EXECUTION_OUTPUT_LIMIT_CHARS', 1_048_576))
+
+# zlib level 1 instead of matplotlib's default 6: much faster encodes for
+# slightly larger PNGs, which are base64'd straight into the response anyway
+PNG_PIL_KWARGS = {'compress_level': 1}
+
+# Parsed DataFrames, per worker process
+_WORKER_DF_CACHE: "OrderedDict[Tuple[str, str], pd.DataFrame]" = OrderedDict()
+_WORKER_DF_CACHE_MAXSIZE = 8
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+# Session payloads published to shared memory by the API process, so workers
+# read them on a cache miss instead of having them pickled into every call.
+# (format, block, size) entries are evicted LRU and unlinked on eviction or shutdown.
+_SHARED_PAYLOADS: "OrderedDict[Tuple[str, str], Tuple[str, shared_memory.SharedMemory, int]]" = OrderedDict()
+_SHARED_PAYLOADS_MAXSIZE = 32
+
+
+# Heavier analysis libraries offered to user code: name -> (module, attribute).
+# They're imported only when the code being run actually refers to the name.
+_LAZY_EXECUTION_GLOBALS: Dict[str, Tuple[str, Optional[str]]] = {
+    'sns': ('seaborn', None),
+    'stats': ('scipy.stats', None),
+    'LinearRegression': ('sklearn.linear_model', 'LinearRegression'),
+    'r2_score': ('sklearn.metrics', 'r2_score'),
+    'px': ('plotly.express', None),
+    'ff': ('plotly.figure_factory', None),
+    'sm': ('statsmodels.api', None),
+    'mcnemar': ('statsmodels.stats.contingency_tables', 'mcnemar'),
+}
+
+
+# Guard rails for code sent to exec. This is not a sandbox; it rejects the
+# obviously dangerous operations before anything runs.
+_BLOCKED_MODULES = {'subprocess', 'socket', 'shutil', 'ctypes', 'multiprocessing', 'pty', 'signal', 'resource'}
+_BLOCKED_OS_CALLS = {
+    'system', 'popen', 'remove', 'unlink', 'rmdir', 'removedirs', 'rename', 'replace',
+    'kill', 'killpg', 'fork', 'forkpty', 'chmod', 'chown', 'truncate', '_exit',
+}
+_BLOCKED_NAMES = {'__import__', '__builtins__'}
+_BLOCKED_ATTRIBUTES = {'__subclasses__', '__globals__', '__code__', '__builtins__'}
+
+
+class UnsafeCodeError(ValueError):
+    """Raised when user code uses an operation the executor refuses to run"""
+
+
+def _is_write_mode(call: ast.Call) -> bool:
+    """Whether an open(...) call passes a literal mode that writes"""
+    mode = call.args[1] if len(call.args) > 1 else next(
+        (kw.value for kw in call.keywords if kw.arg == 'mode'), None
+    )
+    return isinstance(mode, ast.Constant) and isinstance(mode.value, str) and any(c in mode.value for c in 'wax+')
+
+
+def _validate_user_ast(tree: ast.AST):
+    """Reject process/filesystem/introspection escapes in user code"""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name.split('.')[0] in _BLOCKED_MODULES:
+                    raise UnsafeCodeError(f"Importing '{alias.name}' is not allowed")
+        elif isinstance(node, ast.ImportFrom):
+            if node.module and node.module.split('.')[0] in _BLOCKED_MODULES:
+                raise UnsafeCodeError(f"Importing from '{node.module}' is not allowed")
+        elif isinstance(node, ast.Name):
+            if node.id in _BLOCKED_NAMES:
+                raise UnsafeCodeError(f"Use of '{node.id}' is not allowed")
+        elif isinstance(node, ast.Attribute):
+            if node.attr in _BLOCKED_ATTRIBUTES:
+                raise UnsafeCodeError(f"Access to '{node.attr}' is not allowed")
+            if isinstance(node.value, ast.Name) and node.value.id == 'os' and (
+                node.attr in _BLOCKED_OS_CALLS or node.attr.startswith(('exec', 'spawn'))
+            ):
+                raise UnsafeCodeError(f"'os.{node.attr}' is not allowed")
+        elif isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Name) and node.func.id == 'open' and _is_write_mode(node):
+                raise UnsafeCodeError("Opening files for writing is not allowed")
+
+
+@lru_cache(maxsize=512)
+def compile_user_code(code: str) -> CodeType:
+    """Validate and compile user code once; re-runs of the same cell reuse the code object"""
+    tree = ast.parse(code, '<user_code>', 'exec')
+    _validate_user_ast(tree)
+    return compile(tree, '<user_code>', 'exec')
+
+
+def _referenced_names(code_obj: CodeType) -> Set[str]:
+    """Global/attribute names used anywhere in a code object, including nested functions"""
+    names = set(code_obj.co_names)
+    for const in code_obj.co_consts:
+        if isinstance(const, CodeType):
+            names |= _referenced_names(const)
+    return names
+
+
+def add_lazy_globals(code_obj: CodeType, execution_globals: Dict[str, Any]):
+    """Import and bind the lazily provided libraries that code_obj refers to"""
+    for name in _referenced_names(code_obj) & _LAZY_EXECUTION_GLOBALS.keys():
+        if name in execution_globals:
+            continue
+        module_name, attribute = _LAZY_EXECUTION_GLOBALS[name]
+        module = importlib.import_module(module_name)
+        execution_globals[name] = getattr(module, attribute) if attribute else module
+
+
+# Plotly figures constructed while a capture is active on the current thread
+_figure_capture = threading.local()
+_original_figure_init = go.Figure.__init__
+
+
+def _capturing_figure_init(self, *args, **kwargs):
+    _original_figure_init(self, *args, **kwargs)
+    captured = getattr(_figure_capture, 'figures', None)
+    if captured is not None:
+        captured.append(self)
+
+
+# Installed once; a no-op outside capture_plotly_figures() and safe across threads
+go.Figure.__init__ = _capturing_figure_init
+
+
+@contextmanager
+def capture_plotly_figures() -> Iterator[List[go.Figure]]:
+    """Collect every Plotly figure created inside the block, in creation order"""
+    figures: List[go.Figure] = []
+    previous = getattr(_figure_capture, 'figures', None)
+    _figure_capture.figures = figures
+    try:
+        yield figures
+    finally:
+        _figure_capture.figures = previous
+
+
+class RingStringIO(io.StringIO):
+    """StringIO that keeps only the most recent output once it grows past `limit` characters"""
+
+    TRUNCATION_MARKER = "[... earlier output truncated ...]\n"
+
+    def __init__(self, limit: int = EXECUTION_OUTPUT_LIMIT_CHARS):
+        super().__init__()
+        self.limit = limit
+        self.truncated = False
+
+    def write(self, s: str) -> int:
+        written = super().write(s)
+        if self.tell() > self.limit:
+            # Drop to the newest half so trimming stays amortized O(1) per write
+            tail = super().getvalue()[-(self.limit // 2):]
+            self.seek(0)
+            self.truncate()
+            super().write(tail)
+            self.truncated = True
+        return written
+
+    def getvalue(self) -> str:
+        value = super().getvalue()
+        return self.TRUNCATION_MARKER + value if self.truncated else value
+
+
+class SharedPayloadMissing(Exception):
+    """Raised in a worker when the session's shared memory block was already unlinked"""
+
+
+class ExecutionCPULimitExceeded(Exception):
+    """Raised inside a worker when user code exhausts its CPU time budget"""
+
+
+def _on_cpu_limit(signum, frame):
+    raise ExecutionCPULimitExceeded(
+        f"Execution exceeded the CPU time limit of {EXECUTION_CPU_LIMIT_SECONDS} seconds"
+    )
+
+
+def _init_worker():
+    """Per-process setup for pool workers"""
+    warnings.filterwarnings('ignore')
+    if resource is None:
+        return
+    # The soft RLIMIT_CPU is re-armed around every execution; SIGXCPU raises
+    # inside user code instead of killing the worker
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    if EXECUTION_MEMORY_LIMIT_MB > 0:
+        limit = EXECUTION_MEMORY_LIMIT_MB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _set_cpu_soft_limit(budget: Optional[int]):
+    """Allow `budget` more CPU seconds for this process, or lift the soft limit"""
+    if resource is None or EXECUTION_CPU_LIMIT_SECONDS <= 0:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if budget is None:
+        soft = hard
+    else:
+        # RLIMIT_CPU counts the whole process lifetime, so offset from current usage
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime) + budget
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _is_temporal(column: pd.Series) -> bool:
+    """Whether PyArrow inferred a date, time or timestamp type for a column"""
+    if pd.api.types.is_datetime64_any_dtype(column.dtype):
+        return True
+    if column.dtype != object:
+        return False
+    # date32/time32 columns come back as Python date/time objects
+    first = column.first_valid_index()
+    return first is not None and isinstance(column.loc[first], (date, time))
+
+def read_csv_bytes(raw: bytes) -> pd.DataFrame:
+    """Parse raw CSV bytes, preferring the multi-threaded PyArrow engine
+    
+    The result always has the C engine's dtypes. PyArrow infers ISO dates and timestamps as
+    temporal types where the C engine keeps the strings, so those columns are re-read with the
+    C engine. Shared by the upload path and the workers so both always agree on dtypes.
+    """
+    if PYARROW_AVAILABLE:
+        try:
+            df = pd.read_csv(io.BytesIO(raw), engine='pyarrow')
+        except Exception:
+            # PyArrow is stricter about malformed rows; let the C engine have a go
+            pass
+        else:
+            temporal = [name for name, column in df.items() if _is_temporal(column)]
+            if not temporal:
+                return df
+            try:
+                df[temporal] = pd.read_csv(io.BytesIO(raw), usecols=temporal)[temporal]
+                return df
+            except Exception:
+                # e.g. duplicate header names the two engines label differently
+                pass
+    return pd.read_csv(io.BytesIO(raw))
+
+
+def _publish_payload(cache_key: Tuple[str, str], file_feather: Optional[bytes], file_data: str) -> Tuple[str, str, int]:
+    """Copy a session's file into shared memory once; return (format, block name, size)"""
+    entry = _SHARED_PAYLOADS.get(cache_key)
+    if entry is None:
+        if file_feather:
+            fmt, raw = 'feather', file_feather
+        else:
+            fmt, raw = 'csv', base64.b64decode(file_data)
+        block = shared_memory.SharedMemory(create=True, size=max(len(raw), 1))
+        block.buf[:len(raw)] = raw
+        entry = (fmt, block, len(raw))
+        _SHARED_PAYLOADS[cache_key] = entry
+        if len(_SHARED_PAYLOADS) > _SHARED_PAYLOADS_MAXSIZE:
+            _, (_, evicted, _) = _SHARED_PAYLOADS.popitem(last=False)
+            _release_block(evicted)
+    else:
+        _SHARED_PAYLOADS.move_to_end(cache_key)
+    fmt, block, size = entry
+    return fmt, block.name, size
+
+
+def _release_block(block: shared_memory.SharedMemory):
+    try:
+        block.close()
+        block.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _read_shared_payload(payload: Tuple[str, str, int]) -> pd.DataFrame:
+    """Parse a DataFrame out of a block published by _publish_payload"""
+    fmt, name, size = payload
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        raise SharedPayloadMissing(name)
+    try:
+        # Copy out so no pandas buffer outlives the mapping
+        raw = io.BytesIO(block.buf[:size])
+    finally:
+        block.close()
+    if fmt == 'feather':
+        return pd.read_feather(raw)
+    return read_csv_bytes(raw.getvalue())
+
+
+def _get_worker_df(cache_key: Tuple[str, str], payload: Tuple[str, str, int]) -> pd.DataFrame:
+    """Return a fresh copy of the session DataFrame, parsing it once per worker"""
+    df = _WORKER_DF_CACHE.get(cache_key)
+    if df is None:
+        df = _read_shared_payload(payload)
+        _WORKER_DF_CACHE[cache_key] = df
+        if len(_WORKER_DF_CACHE) > _WORKER_DF_CACHE_MAXSIZE:
+            _WORKER_DF_CACHE.popitem(last=False)
+    else:
+        _WORKER_DF_CACHE.move_to_end(cache_key)
+    # User code may mutate df; keep the cached frame pristine
+    return df.copy()
+
+
+def run_user_code(code: str, cache_key: Tuple[str, str], payload: Tuple[str, str, int]) -> Dict[str, Any]:
+    """Execute user code against the session DataFrame and collect its output and plots"""
+    df = _get_worker_df(cache_key, payload)
+
+    # Analyze data types for commonly used variables
+    numeric_cols = df.select_dtypes(include='number').columns.tolist()
+    categorical_cols = df.select_dtypes(include=['object', 'category', 'string']).columns.tolist()
+
+    # Prepare execution environment
+    execution_globals = {
+        'df': df,
+        'pd': pd,
+        'np': np,
+        'plt': plt,
+        'io': io,
+        'base64': base64,
+        'go': go,
+        'pio': pio,
+        'datetime': datetime,
+        'json': json,
+        # Add commonly used data analysis variables
+        'numeric_cols': numeric_cols,
+        'categorical_cols': categorical_cols,
+        'columns': list(df.columns)
+    }
+
+    # Capture output (bounded, so a runaway print loop can't exhaust memory)
+    output_buffer = RingStringIO()
+
+    try:
+        _set_cpu_soft_limit(EXECUTION_CPU_LIMIT_SECONDS)
+
+        code_obj = compile_user_code(code)
+        add_lazy_globals(code_obj, execution_globals)
+
+        # Execute code, recording the Plotly figures it creates
+        with redirect_stdout(output_buffer), redirect_stderr(output_buffer), \
+                capture_plotly_figures() as plotly_figures:
+            exec(code_obj, execution_globals)
+
+        # Get output
+        output = output_buffer.getvalue()
+
+        # Handle matplotlib plots
+        plots = []
+        for manager in Gcf.get_all_fig_managers():
+            fig = manager.canvas.figure
+            buf = io.BytesIO()
+            fig.savefig(buf, format='png', bbox_inches='tight', dpi=100, pil_kwargs=PNG_PIL_KWARGS)
+            plots.append({
+                'type': 'matplotlib',
+                'data': base64.b64encode(buf.getvalue()).decode('utf-8')
+            })
+            buf.close()
+
+        # Handle Plotly plots
+        for fig in plotly_figures:
+            try:
+                plots.append({
+                    'type': 'plotly',
+                    'html': fig.to_html(include_plotlyjs='cdn')
+                })
+            except Exception:
+                pass
+
+        return {
+            "success": True,
+            "output": output,
+            "plots": plots,
+            "error": None
+        }
+
+    except BaseException as e:
+        # BaseException so SystemExit from user code doesn't take the worker down
+        return {
+            "success": False,
+            "output": output_buffer.getvalue(),
+            "plots": [],
+            "error": str(e)
+        }
+
+    finally:
+        _set_cpu_soft_limit(None)
+        plt.close('all')
+
+
+async def execute_user_code(code: str, cache_key: Tuple[str, str], file_feather: Optional[bytes], file_data: str) -> Dict[str, Any]:
+    """Run user code in the worker pool against the given session file"""
+    loop = asyncio.get_running_loop()
+    payload = _publish_payload(cache_key, file_feather, file_data)
+    try:
+        return await loop.run_in_executor(get_execution_pool(), run_user_code, code, cache_key, payload)
+    except SharedPayloadMissing:
+        # Evicted between publishing and the worker attaching; publish again once
+        payload = _publish_payload(cache_key, file_feather, file_data)
+        return await loop.run_in_executor(get_execution_pool(), run_user_code, code, cache_key, payload)
+
+
+def _warmup() -> int:
+    """No-op task; importing this module in the worker does the real warm-up"""
+    return os.getpid()
+
+
+async def warm_execution_pool():
+    """Start every worker now so the first /execute doesn't pay process start and imports"""
+    loop = asyncio.get_running_loop()
+    pool = get_execution_pool()
+    try:
+        pids = await asyncio.gather(*(loop.run_in_executor(pool, _warmup) for _ in range(EXECUTION_WORKERS)))
+        logger.info(f"Code execution pool warmed ({len(set(pids))} workers)")
+    except Exception as e:
+        logger.warning(f"Code execution pool warm-up failed: {e}")
+
+
+def _mp_context():
+    # Never fork the API process: it holds Motor's and asyncio's threads
+    if 'forkserver' in mp.get_all_start_methods():
+        ctx = mp.get_context('forkserver')
+        # Children fork from a server that already imported the analysis stack,
+        # so the lazy libraries are shared copy-on-write rather than imported per worker
+        ctx.set_forkserver_preload([__name__] + sorted({module for module, _ in _LAZY_EXECUTION_GLOBALS.values()}))
+        return ctx
+    return mp.get_context('spawn')
+
+
+def get_execution_pool() -> ProcessPoolExecutor:
+    """Return the shared worker pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=EXECUTION_WORKERS,
+            mp_context=_mp_context(),
+            initializer=_init_worker,
+        )
+        logger.info(f"Started code execution pool with {EXECUTION_WORKERS} workers")
+    return _pool
+
+
+def reset_execution_pool():
+    """Discard a broken pool (e.g. a worker was OOM-killed) so the next call starts a new one"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def shutdown_execution_pool():
+    """Stop the worker processes and release the shared session payloads"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+    while _SHARED_PAYLOADS:
+        _, (_, block, _) = _SHARED_PAYLOADS.popitem()
+        _release_block(block)
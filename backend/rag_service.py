@@ -832,10 +832,17 @@ class EnhancedRAGService:
             except Exception:
                 return {}
         
+        # Chunk counts per strategy, read from the stored metadata (no embedding work)
+        chunk_types: Dict[str, int] = {}
+        for metadata in collection.get(include=["metadatas"])["metadatas"] or []:
+            chunk_type = (metadata or {}).get("chunk_type", "unknown")
+            chunk_types[chunk_type] = chunk_types.get(chunk_type, 0) + 1
+        
         return {
             "name": collection.name,
             "count": collection.count(),
-            "metadata": collection.metadata
+            "metadata": collection.metadata,
+            "chunk_types": chunk_types
         }
     
     def delete_collection(self, session_id: str) -> bool:
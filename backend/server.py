@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile, Form, Response
+from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile, Form, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -11,34 +12,45 @@ import uuid
 from datetime import datetime
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # headless server; never pick up an interactive backend
 import matplotlib.pyplot as plt
-import seaborn as sns
+from matplotlib._pylab_helpers import Gcf
 import plotly.graph_objects as go
-import plotly.express as px
-import plotly.figure_factory as ff
 import plotly.io as pio
 import io
 import base64
 import json
+import orjson
+import hashlib
 import asyncio
 import subprocess
 import sys
 import tempfile
 from scipy import stats
-from sklearn.linear_model import LinearRegression
-from sklearn.metrics import r2_score
-import statsmodels.api as sm
-from statsmodels.stats.contingency_tables import mcnemar
+# seaborn, plotly.express/figure_factory, sklearn and statsmodels are only used by
+# executed user code; execution_service imports them on first reference
 # from lifelines import KaplanMeierFitter, CoxPHFitter
 # from lifelines.statistics import logrank_test
 import warnings
 import time
 import logging
+from functools import lru_cache
+from contextlib import redirect_stderr, redirect_stdout
+from collections import OrderedDict
 warnings.filterwarnings('ignore')
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# User code for /execute runs in a separate process pool
+from concurrent.futures.process import BrokenProcessPool
+from execution_service import (
+    PNG_PIL_KWARGS, PYARROW_AVAILABLE, RingStringIO, add_lazy_globals, capture_plotly_figures,
+    compile_user_code, execute_user_code, read_csv_bytes, reset_execution_pool,
+    shutdown_execution_pool, warm_execution_pool
+)
+
 # Import comprehensive data analysis services
 from simple_data_analysis_service import ComprehensiveDataAnalyzer
 
@@ -376,6 +388,73 @@ class AnalysisClassifier:
         else:
             return 'bar'  # Default
 
+# Parsed session DataFrames keyed by (session_id, file_hash), least recently used first
+_DF_CACHE: "OrderedDict[tuple[str, str], pd.DataFrame]" = OrderedDict()
+_DF_CACHE_MAXSIZE = 32
+
+def _file_hash(file_data: str) -> str:
+    """Fingerprint of a session's stored file, used to key the DataFrame cache"""
+    return hashlib.sha1(file_data.encode('utf-8')).hexdigest()
+
+def _encode_feather(df: pd.DataFrame) -> Optional[bytes]:
+    """Serialize a DataFrame as Feather (Arrow IPC) bytes, or None if Arrow can't represent it"""
+    if not PYARROW_AVAILABLE:
+        return None
+    try:
+        buf = io.BytesIO()
+        df.reset_index(drop=True).to_feather(buf)
+        return buf.getvalue()
+    except Exception:
+        # e.g. object columns mixing strings and numbers after a cell edit
+        return None
+
+# MongoDB rejects documents over 16 MB. The Feather copy only speeds up loading, so it is
+# left out when both file copies together would exceed this (headroom for the preview fields)
+_MAX_SESSION_FILE_BYTES = 15 * 1024 * 1024
+
+def _session_file_fields(file_data: str, df: Optional[pd.DataFrame] = None) -> dict:
+    """Stored-file fields of a session document, always written together so they stay in sync"""
+    file_feather = _encode_feather(df) if df is not None else None
+    if file_feather is not None and len(file_data) + len(file_feather) > _MAX_SESSION_FILE_BYTES:
+        # Loads fall back to parsing the CSV copy
+        file_feather = None
+    return {
+        "file_data": file_data,
+        "file_hash": _file_hash(file_data),
+        "file_feather": file_feather,
+    }
+
+@lru_cache(maxsize=256)
+def _dtype_kind(dtype_name: str) -> str:
+    """NumPy kind code ('i', 'u', 'f', 'O', ...) for a stored dtype string; 'O' if unparseable"""
+    try:
+        return pd.api.types.pandas_dtype(dtype_name).kind
+    except TypeError:
+        return 'O'
+
+def _load_session_df(session: dict) -> pd.DataFrame:
+    """Return the session's DataFrame, parsing the stored CSV only on a cache miss.
+    
+    A copy is returned so user code and cleaning operations never modify the cached frame.
+    """
+    file_data = session['file_data']
+    key = (session['id'], session.get('file_hash') or _file_hash(file_data))
+    
+    df = _DF_CACHE.get(key)
+    if df is None:
+        if session.get('file_feather'):
+            # Binary Arrow copy written alongside the CSV; no tokenizing or type inference
+            df = pd.read_feather(io.BytesIO(session['file_feather']))
+        else:
+            df = read_csv_bytes(base64.b64decode(file_data))
+        _DF_CACHE[key] = df
+        if len(_DF_CACHE) > _DF_CACHE_MAXSIZE:
+            _DF_CACHE.popitem(last=False)
+    else:
+        _DF_CACHE.move_to_end(key)
+    
+    return df.copy()
+
 # Enhanced Python execution engine
 class JuliusStyleExecutor:
     
@@ -383,22 +462,21 @@ class JuliusStyleExecutor:
         self.session_data = session_data
         self.df = None
         self.execution_globals = {}
+        self._plotly_figures = []
         self._setup_execution_environment()
     
     def _setup_execution_environment(self):
         """Setup the execution environment with data and libraries"""
-        # Decode CSV data
+        # Load CSV data (cached per session)
         if self.session_data.get('file_data'):
-            csv_data = base64.b64decode(self.session_data['file_data']).decode('utf-8')
-            self.df = pd.read_csv(io.StringIO(csv_data))
+            self.df = _load_session_df(self.session_data)
         
         # Analyze data types for commonly used variables
         numeric_cols = []
         categorical_cols = []
         if self.df is not None:
-            dtypes = self.df.dtypes.to_dict()
-            numeric_cols = [col for col, dtype in dtypes.items() if 'int' in str(dtype) or 'float' in str(dtype)]
-            categorical_cols = [col for col, dtype in dtypes.items() if 'object' in str(dtype)]
+            numeric_cols = self.df.select_dtypes(include='number').columns.tolist()
+            categorical_cols = self.df.select_dtypes(include=['object', 'category', 'string']).columns.tolist()
         
         # Setup execution globals
         self.execution_globals = {
@@ -406,18 +484,11 @@ class JuliusStyleExecutor:
             'pd': pd,
             'np': np,
             'plt': plt,
-            'sns': sns,
             'stats': stats,
-            'LinearRegression': LinearRegression,
-            'r2_score': r2_score,
             'io': io,
             'base64': base64,
             'go': go,
-            'px': px,
-            'ff': ff,
             'pio': pio,
-            'sm': sm,
-            'mcnemar': mcnemar,
             # 'KaplanMeierFitter': KaplanMeierFitter,
             # 'CoxPHFitter': CoxPHFitter,
             # 'logrank_test': logrank_test,
@@ -505,20 +576,22 @@ class JuliusStyleExecutor:
         """Execute a single code section with enhanced error handling"""
         section_type, _ = AnalysisClassifier.classify_code_section(code)
         
-        # Capture output
-        output_buffer = io.StringIO()
-        old_stdout = sys.stdout
+        # Capture output (bounded, so a runaway print loop can't exhaust memory)
+        output_buffer = RingStringIO()
         execution_start_time = datetime.utcnow()
         
         try:
-            sys.stdout = output_buffer
-            
             # Clear any existing plots to avoid conflicts
             plt.clf()
             plt.close('all')
             
-            # Execute code with timeout protection
-            exec(code, self.execution_globals)
+            code_obj = compile_user_code(code)
+            add_lazy_globals(code_obj, self.execution_globals)
+            
+            # Execute code with timeout protection, recording the Plotly figures it creates
+            with redirect_stdout(output_buffer), redirect_stderr(output_buffer), \
+                    capture_plotly_figures() as self._plotly_figures:
+                exec(code_obj, self.execution_globals)
             
             # Get output
             output = output_buffer.getvalue()
@@ -630,7 +703,6 @@ class JuliusStyleExecutor:
                 order=order
             )
         finally:
-            sys.stdout = old_stdout
             # Clean up plots to prevent memory leaks
             try:
                 plt.clf()
@@ -644,58 +716,58 @@ class JuliusStyleExecutor:
         
         try:
             # Handle matplotlib plots with enhanced error handling
-            if plt.get_fignums():
-                for fig_num in plt.get_fignums():
+            # Walk the open figure managers directly instead of re-activating each with plt.figure(n)
+            for manager in Gcf.get_all_fig_managers():
+                fig_num = manager.num
+                try:
+                    fig = manager.canvas.figure
+                    buf = io.BytesIO()
+                    
+                    # Use different formats based on complexity
                     try:
-                        fig = plt.figure(fig_num)
-                        buf = io.BytesIO()
-                        
-                        # Use different formats based on complexity
-                        try:
-                            fig.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-                        except Exception:
-                            # Fallback to simpler format
-                            fig.savefig(buf, format='png', dpi=80)
-                        
-                        buf.seek(0)
-                        plot_data = base64.b64encode(buf.read()).decode('utf-8')
-                        
+                        fig.savefig(buf, format='png', bbox_inches='tight', dpi=100, pil_kwargs=PNG_PIL_KWARGS)
+                    except Exception:
+                        # Fallback to simpler format
+                        fig.savefig(buf, format='png', dpi=80, pil_kwargs=PNG_PIL_KWARGS)
+                    
+                    buf.seek(0)
+                    plot_data = base64.b64encode(buf.read()).decode('utf-8')
+                    
+                    chart_type = AnalysisClassifier.determine_chart_type(code, "")
+                    charts.append({
+                        'type': 'matplotlib',
+                        'chart_type': chart_type,
+                        'data': plot_data,
+                        'title': f'{chart_type.title()} Chart',
+                        'fig_num': fig_num
+                    })
+                    
+                    plt.close(fig)
+                    
+                except Exception as e:
+                    if not ignore_errors:
+                        print(f"Warning: Failed to extract matplotlib figure {fig_num}: {e}")
+                    continue
+            
+            # Handle plotly plots created by this section
+            if self._plotly_figures:
+                var_names = {id(value): name for name, value in self.execution_globals.items()}
+                for fig in self._plotly_figures:
+                    var_name = var_names.get(id(fig))
+                    try:
+                        html_str = fig.to_html(include_plotlyjs='cdn')
                         chart_type = AnalysisClassifier.determine_chart_type(code, "")
                         charts.append({
-                            'type': 'matplotlib',
+                            'type': 'plotly',
                             'chart_type': chart_type,
-                            'data': plot_data,
-                            'title': f'{chart_type.title()} Chart',
-                            'fig_num': fig_num
+                            'data': html_str,
+                            'title': f'{chart_type.title()} Chart (Interactive)',
+                            'variable_name': var_name
                         })
-                        
-                        plt.close(fig)
-                        
                     except Exception as e:
                         if not ignore_errors:
-                            print(f"Warning: Failed to extract matplotlib figure {fig_num}: {e}")
+                            print(f"Warning: Failed to extract plotly figure {var_name}: {e}")
                         continue
-            
-            # Handle plotly plots with error handling
-            for var_name, var_value in self.execution_globals.items():
-                try:
-                    if hasattr(var_value, '_module') and 'plotly' in str(var_value._module):
-                        try:
-                            html_str = var_value.to_html(include_plotlyjs='cdn')
-                            chart_type = AnalysisClassifier.determine_chart_type(code, "")
-                            charts.append({
-                                'type': 'plotly',
-                                'chart_type': chart_type,
-                                'data': html_str,
-                                'title': f'{chart_type.title()} Chart (Interactive)',
-                                'variable_name': var_name
-                            })
-                        except Exception as e:
-                            if not ignore_errors:
-                                print(f"Warning: Failed to extract plotly figure {var_name}: {e}")
-                            continue
-                except Exception:
-                    continue
                     
         except Exception as e:
             if not ignore_errors:
@@ -705,14 +777,14 @@ class JuliusStyleExecutor:
     
     def _calculate_section_complexity(self, code: str) -> str:
         """Calculate complexity level of code section"""
-        lines = code.split('\n')
+        # Lowercase once up front rather than per line and per check
+        lines = code.lower().split('\n')
         non_empty_lines = [line for line in lines if line.strip() and not line.strip().startswith('#')]
         
         complexity_score = 0
         
         # Count complexity indicators
-        for line in non_empty_lines:
-            line_lower = line.lower()
+        for line_lower in non_empty_lines:
             if any(pattern in line_lower for pattern in ['for', 'while', 'if', 'elif', 'try', 'except']):
                 complexity_score += 2
             if any(pattern in line_lower for pattern in ['lambda', 'list comprehension', 'nested']):
@@ -787,11 +859,59 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
-# Create the main app without a prefix
-app = FastAPI()
+# Short-lived cache of session metadata used by the chat endpoint
+# (session_id -> (fetched_at, session document without file_data)), least recently used first
+_SESSION_CACHE: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+_SESSION_CACHE_MAXSIZE = 256
+
+# Analysis suggestions are reused for identical prompts (same file, same template)
+# for a day; expiry is handled by a TTL index on created_at
+_SUGGESTION_MODEL = "gemini-2.5-flash"
+_SUGGESTION_CACHE_TTL_SECONDS = 86400
+
+# Batched writer for analysis_results: saves enqueue (document, future) pairs and
+# one background task writes everything that has accumulated with a single
+# insert_many. Each save still awaits its own write, so history reads see it.
+_ANALYSIS_WRITE_BATCH_SIZE = 50
+_analysis_write_queue: Optional[asyncio.Queue] = None
+_analysis_writer_task: Optional[asyncio.Task] = None
+
+async def _analysis_result_writer():
+    """Drain the analysis write queue, up to _ANALYSIS_WRITE_BATCH_SIZE documents per insert"""
+    while True:
+        batch = [await _analysis_write_queue.get()]
+        # No linger timer: a batch is whatever queued up while the last insert was in flight
+        while len(batch) < _ANALYSIS_WRITE_BATCH_SIZE and not _analysis_write_queue.empty():
+            batch.append(_analysis_write_queue.get_nowait())
+        try:
+            await db.analysis_results.insert_many([doc for doc, _ in batch], ordered=False)
+        except Exception as e:
+            logger.error(f"Batched analysis_results insert failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+        finally:
+            for _ in batch:
+                _analysis_write_queue.task_done()
+
+async def _queue_analysis_result(document: dict):
+    """Insert an analysis result through the batch writer and wait until it is stored"""
+    if _analysis_writer_task is None or _analysis_writer_task.done():
+        await db.analysis_results.insert_one(document)
+        return
+    future = asyncio.get_running_loop().create_future()
+    await _analysis_write_queue.put((document, future))
+    await future
+
+# Create the main app without a prefix (orjson handles datetimes and numpy values natively)
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", default_response_class=ORJSONResponse)
 
 # Models
 class ChatSession(BaseModel):
@@ -800,6 +920,7 @@ class ChatSession(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     file_name: str
     file_data: Optional[str] = None  # Base64 encoded CSV data
+    file_hash: Optional[str] = None  # SHA-1 of file_data, keys the parsed DataFrame cache
     csv_preview: Optional[Dict] = None
 
 class ChatMessage(BaseModel):
@@ -810,6 +931,20 @@ class ChatMessage(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     analysis_result: Optional[Dict] = None
 
+class ChatBatchItem(BaseModel):
+    message: str
+    gemini_api_key: str
+
+# Upper bound on the prompts in one chat-batch request, and on how many of them
+# are sent to the LLM at the same time when the items are independent
+_CHAT_BATCH_MAX_ITEMS = 20
+_CHAT_BATCH_CONCURRENCY = 4
+
+class ChatBatchRequest(BaseModel):
+    items: List[ChatBatchItem] = Field(..., max_length=_CHAT_BATCH_MAX_ITEMS)
+    # Items that don't build on each other's replies can be answered concurrently
+    independent: bool = False
+
 class APIKeyConfig(BaseModel):
     gemini_api_key: str
 
@@ -974,13 +1109,6 @@ class CellEditRequest(BaseModel):
     column_name: str
     new_value: Any
 
-class EnhancedPythonExecutionRequest(BaseModel):
-    session_id: str
-    code: str
-    gemini_api_key: str
-    analysis_title: Optional[str] = "Statistical Analysis"
-    auto_section: bool = True  # Whether to auto-detect analysis sections
-
 # Data Cleaning Service
 class DataCleaningService:
     
@@ -1220,263 +1348,6 @@ async def test_connection(request: TestConnectionRequest):
         else:
             raise HTTPException(status_code=500, detail=f"Connection test failed: {error_msg}")
 
-async def _create_analysis_chat_messages(session_id: str, analysis_results: dict):
-    """Create automatic chat messages based on comprehensive analysis results"""
-    try:
-        # Extract executive summary
-        executive_summary = analysis_results.get('executive_summary', {})
-        
-        # Create main overview message
-        content = f"""# 🎯 **AI Statistical Analysis Complete**
-
-## **Executive Summary**
-**Quality Score:** {executive_summary.get('quality_grade', 'Not Available')} ({executive_summary.get('overall_quality_score', 0):.1f}%)
-**Dataset:** {executive_summary.get('dataset_size', 'Unknown size')}
-
-## **📋 Key Findings**"""
-        
-        key_findings = executive_summary.get('key_findings', [])
-        if key_findings:
-            for finding in key_findings:
-                content += f"\n• {finding}"
-        else:
-            content += "\n• Dataset successfully analyzed with all three analysis tools"
-        
-        content += "\n\n## **🚀 Priority Recommendations**"
-        priority_recs = executive_summary.get('priority_recommendations', [])
-        if priority_recs:
-            for rec in priority_recs:
-                content += f"\n• {rec}"
-        else:
-            content += "\n• Dataset appears to be in good condition for analysis"
-        
-        content += f"""
-
-## **📊 Analysis Tools Completed**"""
-        
-        completion_status = executive_summary.get('analysis_completion', {})
-        tools_status = []
-        if completion_status.get('ydata_profiling'):
-            tools_status.append("✅ **ydata-profiling** - Complete data understanding")
-        if completion_status.get('great_expectations'):
-            tools_status.append("✅ **Great Expectations** - Data validation & quality")
-        if completion_status.get('sweetviz'):
-            tools_status.append("✅ **Sweetviz** - Visual data exploration")
-        
-        for status in tools_status:
-            content += f"\n{status}"
-        
-        content += f"""
-
-## **🎯 Next Steps**
-1. Review the detailed analysis insights above
-2. Ask specific questions about your data patterns
-3. Request custom statistical analyses or visualizations
-4. Begin exploring relationships between variables
-
-**Ready to explore your data! Ask me anything about the dataset.**"""
-        
-        # Create the main message
-        main_message = ChatMessage(
-            session_id=session_id,
-            role="assistant",
-            content=content
-        )
-        await db.chat_messages.insert_one(main_message.dict())
-        
-        # Create detailed analysis summaries for each tool
-        ydata_result = analysis_results.get('ydata_profiling', {})
-        if ydata_result.get('status') == 'success':
-            await _create_ydata_profiling_message(session_id, ydata_result)
-        
-        expectations_result = analysis_results.get('great_expectations', {})
-        if expectations_result.get('status') == 'success':
-            await _create_great_expectations_message(session_id, expectations_result)
-        
-        sweetviz_result = analysis_results.get('sweetviz', {})
-        if sweetviz_result.get('status') == 'success':
-            await _create_sweetviz_message(session_id, sweetviz_result)
-            
-    except Exception as e:
-        # Fallback message if detailed processing fails
-        fallback_message = ChatMessage(
-            session_id=session_id,
-            role="assistant",
-            content=f"""# 📊 **Data Analysis Complete**
-
-Your dataset has been successfully analyzed using our comprehensive AI statistical analysis suite.
-
-**Analysis Tools Used:**
-• ydata-profiling for complete data understanding
-• Great Expectations for data validation
-• Sweetviz for visual data exploration
-
-The analysis is ready! You can now ask questions about your data, request specific analyses, or explore patterns and relationships.
-
-**Ask me anything about your dataset!**"""
-        )
-        await db.chat_messages.insert_one(fallback_message.dict())
-
-async def _create_ydata_profiling_message(session_id: str, ydata_result: dict):
-    """Create detailed message for ydata-profiling results"""
-    try:
-        key_insights = ydata_result.get('key_insights', {})
-        recommendations = ydata_result.get('recommendations', [])
-        
-        content = f"""# 🔍 **ydata-profiling - Complete Data Understanding**
-
-## **Data Type Detection**
-{_format_data_types(key_insights.get('data_types_detected', {}))}
-
-## **Missing Values Analysis**
-{_format_missing_values(key_insights.get('missing_values', {}))}
-
-## **Data Quality Warnings**
-{_format_warnings(key_insights.get('data_quality_warnings', []))}
-
-## **Recommendations**"""
-        
-        if recommendations:
-            for rec in recommendations:
-                content += f"\n• {rec}"
-        else:
-            content += "\n• No specific recommendations - data appears clean"
-        
-        content += "\n\n*Full detailed report generated and saved for deeper analysis.*"
-        
-        message = ChatMessage(
-            session_id=session_id,
-            role="assistant",
-            content=content
-        )
-        await db.chat_messages.insert_one(message.dict())
-        
-    except Exception as e:
-        print(f"Error creating ydata-profiling message: {str(e)}")
-
-async def _create_great_expectations_message(session_id: str, expectations_result: dict):
-    """Create detailed message for Great Expectations results"""
-    try:
-        summary = expectations_result.get('summary', {})
-        quality_score = expectations_result.get('overall_quality_score', 0)
-        recommendations = expectations_result.get('recommendations', [])
-        
-        content = f"""# ✅ **Great Expectations - Data Quality Validation**
-
-## **Quality Assessment**
-**Overall Score:** {quality_score:.1f}% ({summary.get('quality_grade', 'N/A')})
-
-## **Validation Results**
-• **Total Validations:** {summary.get('total_expectations', 0)}
-• **Passed:** {summary.get('successful_expectations', 0)}
-• **Failed:** {summary.get('failed_expectations', 0)}
-
-## **Recommendations**"""
-        
-        if recommendations:
-            for rec in recommendations:
-                content += f"\n• {rec}"
-        else:
-            content += "\n• Data quality meets acceptable standards"
-        
-        message = ChatMessage(
-            session_id=session_id,
-            role="assistant",
-            content=content
-        )
-        await db.chat_messages.insert_one(message.dict())
-        
-    except Exception as e:
-        print(f"Error creating Great Expectations message: {str(e)}")
-
-async def _create_sweetviz_message(session_id: str, sweetviz_result: dict):
-    """Create detailed message for Sweetviz results"""
-    try:
-        insights = sweetviz_result.get('insights', {})
-        data_overview = insights.get('data_overview', {})
-        quality_insights = insights.get('quality_insights', {})
-        recommendations = sweetviz_result.get('recommendations', [])
-        
-        content = f"""# 📈 **Sweetviz - Visual Data Exploration**
-
-## **Feature Analysis**
-• **Total Features:** {data_overview.get('total_features', 0)}
-• **Categorical:** {data_overview.get('categorical_features', 0)}
-• **Numerical:** {data_overview.get('numerical_features', 0)}
-• **Datetime:** {data_overview.get('datetime_features', 0)}
-
-## **Data Quality Insights**
-• **Completeness:** {quality_insights.get('completeness_score', 0):.1f}%
-• **Duplicate Rows:** {quality_insights.get('duplicate_rows', 0)}
-
-## **Recommendations**"""
-        
-        if recommendations:
-            for rec in recommendations:
-                content += f"\n• {rec}"
-        else:
-            content += "\n• Visual analysis complete - data ready for exploration"
-        
-        content += "\n\n*Interactive visual report generated for detailed exploration.*"
-        
-        message = ChatMessage(
-            session_id=session_id,
-            role="assistant",
-            content=content
-        )
-        await db.chat_messages.insert_one(message.dict())
-        
-    except Exception as e:
-        print(f"Error creating Sweetviz message: {str(e)}")
-
-def _format_data_types(data_types: dict) -> str:
-    """Format data types for display"""
-    if not data_types:
-        return "• Data types automatically detected"
-    
-    formatted = ""
-    for col, info in list(data_types.items())[:5]:  # Limit to 5 columns
-        formatted += f"\n• **{col}:** {info.get('type', 'unknown')}"
-    
-    if len(data_types) > 5:
-        formatted += f"\n• *...and {len(data_types) - 5} more columns*"
-    
-    return formatted
-
-def _format_missing_values(missing_values: dict) -> str:
-    """Format missing values for display"""
-    if not missing_values:
-        return "• No missing values detected"
-    
-    high_missing = {col: info for col, info in missing_values.items() 
-                   if info.get('missing_percentage', 0) > 10}
-    
-    if not high_missing:
-        return "• Minimal missing values detected (< 10% in all columns)"
-    
-    formatted = ""
-    for col, info in list(high_missing.items())[:3]:  # Limit to 3 columns
-        formatted += f"\n• **{col}:** {info.get('missing_percentage', 0):.1f}% missing"
-    
-    if len(high_missing) > 3:
-        formatted += f"\n• *...and {len(high_missing) - 3} more columns with missing values*"
-    
-    return formatted
-
-def _format_warnings(warnings: list) -> str:
-    """Format warnings for display"""
-    if not warnings:
-        return "• No data quality warnings detected"
-    
-    formatted = ""
-    for warning in warnings[:3]:  # Limit to 3 warnings
-        formatted += f"\n• {warning.get('message', 'Data quality issue detected')}"
-    
-    if len(warnings) > 3:
-        formatted += f"\n• *...and {len(warnings) - 3} more warnings*"
-    
-    return formatted
-
 @api_router.post("/sessions")
 async def create_session(file: UploadFile = File(...)):
     """Create a new chat session with CSV file upload and automatic comprehensive analysis"""
@@ -1488,32 +1359,39 @@ async def create_session(file: UploadFile = File(...)):
         # Read and validate CSV
         content = await file.read()
         try:
-            df = pd.read_csv(io.StringIO(content.decode('utf-8')))
+            df = read_csv_bytes(content)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid CSV file: {str(e)}")
         
+        # Column typing is computed once here; suggest_analysis reads it from the preview
+        numeric_cols = df.select_dtypes(include='number').columns.tolist()
+        categorical_cols = df.select_dtypes(include=['object', 'category', 'string']).columns.tolist()
+        
         # Create preview data with proper type conversion
         preview = {
             "columns": df.columns.tolist(),
             "shape": [int(df.shape[0]), int(df.shape[1])],  # Convert numpy ints to Python ints
-            "head": df.head().to_dict('records'),
+            "head": df.head(5).to_dict(orient='split'),  # {'index', 'columns', 'data'}; column names are not repeated per row
             "dtypes": df.dtypes.astype(str).to_dict(),
             "null_counts": {k: int(v) for k, v in df.isnull().sum().to_dict().items()},  # Convert numpy ints to Python ints
-            "describe": {k: {k2: float(v2) if isinstance(v2, (np.integer, np.floating)) else v2 
-                           for k2, v2 in v.items()} for k, v in df.describe().to_dict().items()} 
-                       if len(df.select_dtypes(include=[np.number]).columns) > 0 else {}
+            # Single float64 cast; to_dict() then yields native Python floats for BSON storage
+            "describe": df.describe().astype('float64').to_dict() if numeric_cols else {},
+            "numeric_cols": numeric_cols,
+            "categorical_cols": categorical_cols
         }
         
         # Create session
+        file_fields = _session_file_fields(base64.b64encode(content).decode('utf-8'), df)
         session = ChatSession(
             title=file.filename,
             file_name=file.filename,
-            file_data=base64.b64encode(content).decode('utf-8'),
+            file_data=file_fields['file_data'],
+            file_hash=file_fields['file_hash'],
             csv_preview=preview
         )
         
-        # Save session to database first
-        await db.chat_sessions.insert_one(session.dict())
+        # Save session to database first (the Feather copy is storage-only, not part of the model)
+        await db.chat_sessions.insert_one({**session.dict(), **file_fields})
         
         # Create RAG vector database collection for this session
         if RAG_ENABLED and rag_service:
@@ -1530,7 +1408,8 @@ async def create_session(file: UploadFile = File(...)):
         try:
             # Use basic analyzer for fast uploads
             analyzer = ComprehensiveDataAnalyzer()
-            analysis_results = analyzer.analyze_dataset(df, file.filename)
+            # CPU-bound pandas work runs in a worker thread so the event loop keeps serving requests
+            analysis_results = await asyncio.to_thread(analyzer.analyze_dataset, df, file.filename)
             
             # Save basic analysis results
             comprehensive_analysis = ComprehensiveAnalysisResult(
@@ -1578,31 +1457,72 @@ You can start by asking: "What are the key characteristics of this dataset?" or
 @api_router.get("/sessions")
 async def get_sessions():
     """Get all chat sessions"""
-    sessions = await db.chat_sessions.find().sort("created_at", -1).to_list(100)
+    sessions = await db.chat_sessions.find({}, projection={"file_feather": 0}).sort("created_at", -1).to_list(100)
     return [ChatSession(**session) for session in sessions]
 
 @api_router.get("/sessions/{session_id}")
 async def get_session(session_id: str):
     """Get a specific session"""
-    session = await db.chat_sessions.find_one({"id": session_id})
+    session = await db.chat_sessions.find_one({"id": session_id}, projection={"file_feather": 0})
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     return ChatSession(**session)
 
 @api_router.get("/sessions/{session_id}/messages")
-async def get_messages(session_id: str):
-    """Get messages for a session"""
-    messages = await db.chat_messages.find({"session_id": session_id}).sort("timestamp", 1).to_list(1000)
+async def get_messages(session_id: str, request: Request):
+    """Get messages for a session, streamed one JSON object per line if the client accepts NDJSON"""
+    cursor = db.chat_messages.find({"session_id": session_id}).sort("timestamp", 1).limit(1000)
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        async def message_lines():
+            async for message in cursor:
+                yield orjson.dumps(ChatMessage(**message).dict(), option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+        return StreamingResponse(message_lines(), media_type="application/x-ndjson")
+    messages = await cursor.to_list(1000)
     return [ChatMessage(**message) for message in messages]
 
+@api_router.get("/sessions/{session_id}/context")
+async def get_session_context(session_id: str):
+    """Describe the RAG context prepared for a session (chunk strategies and counts)"""
+    session = await _get_session_cached(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    collection_info = {}
+    if RAG_ENABLED and rag_service:
+        collection_info = await asyncio.to_thread(rag_service.get_collection_info, session_id)
+    
+    return {
+        "session_id": session_id,
+        "rag_enabled": bool(collection_info),
+        "chunk_count": collection_info.get("count", 0),
+        "chunk_types": collection_info.get("chunk_types", {})
+    }
+
+async def _get_session_cached(session_id: str, ttl: float = 60) -> Optional[dict]:
+    """Fetch session metadata, reusing a cached copy for up to `ttl` seconds"""
+    cached = _SESSION_CACHE.get(session_id)
+    if cached:
+        if time.monotonic() - cached[0] < ttl:
+            _SESSION_CACHE.move_to_end(session_id)
+            return cached[1]
+        # Expired entries are dropped on lookup instead of lingering until evicted
+        del _SESSION_CACHE[session_id]
+    
+    session = await db.chat_sessions.find_one({"id": session_id}, projection={"file_data": 0, "file_feather": 0})
+    if session:
+        _SESSION_CACHE[session_id] = (time.monotonic(), session)
+        if len(_SESSION_CACHE) > _SESSION_CACHE_MAXSIZE:
+            _SESSION_CACHE.popitem(last=False)
+    return session
+
 @api_router.post("/sessions/{session_id}/chat")
 async def chat_with_llm(session_id: str, message: str = Form(...), gemini_api_key: str = Form(...)):
     """Enhanced chat with LLM using RAG system for intelligent context retrieval"""
     try:
         start_time = time.time()
         
-        # Get session
-        session = await db.chat_sessions.find_one({"id": session_id})
+        # Get session (metadata only, cached between chat turns)
+        session = await _get_session_cached(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
@@ -1638,13 +1558,14 @@ async def chat_with_llm(session_id: str, message: str = Form(...), gemini_api_ke
                     rag_context = "**📊 Most Relevant Data Context:**\n\n"
                     for i, chunk in enumerate(context_chunks):
                         # Add smart context labeling based on content
-                        if 'statistical summary' in chunk.lower():
+                        chunk_lower = chunk.lower()
+                        if 'statistical summary' in chunk_lower:
                             label = f"📈 Statistical Summary {i+1}"
-                        elif 'correlation' in chunk.lower():
+                        elif 'correlation' in chunk_lower:
                             label = f"🔗 Correlation Analysis {i+1}"
-                        elif 'rows' in chunk.lower() and 'columns' in chunk.lower():
+                        elif 'rows' in chunk_lower and 'columns' in chunk_lower:
                             label = f"📋 Data Overview {i+1}"
-                        elif any(term in chunk.lower() for term in ['mean', 'std', 'median']):
+                        elif any(term in chunk_lower for term in ['mean', 'std', 'median']):
                             label = f"📊 Statistical Measures {i+1}"
                         else:
                             label = f"📄 Data Context {i+1}"
@@ -1905,6 +1826,36 @@ IMPORTANT: Each section must contain substantial, specific content. Do not use g
             raise HTTPException(status_code=500, detail=str(e))
             raise HTTPException(status_code=500, detail=f"LLM Error: {error_msg}")
 
+@api_router.post("/sessions/{session_id}/chat-batch")
+async def chat_with_llm_batch(session_id: str, request: ChatBatchRequest):
+    """Run several chat prompts in one request; each item reports its own status
+    
+    Each reply is built from the dataset context and its own prompt only, never from the
+    other items. Independent items run concurrently, so their user and assistant messages
+    may interleave in the stored history; without the flag every prompt is stored right
+    before its reply, in item order.
+    """
+    session = await _get_session_cached(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    llm_slots = asyncio.Semaphore(_CHAT_BATCH_CONCURRENCY)
+    
+    async def answer(item: ChatBatchItem) -> dict:
+        if not item.gemini_api_key:
+            return {"status": 422, "detail": "Gemini API key is required"}
+        try:
+            async with llm_slots:
+                result = await chat_with_llm(session_id, message=item.message, gemini_api_key=item.gemini_api_key)
+            return {"status": 200, "response": result["response"]}
+        except HTTPException as e:
+            return {"status": e.status_code, "detail": e.detail}
+    
+    if request.independent:
+        return list(await asyncio.gather(*(answer(item) for item in request.items)))
+    
+    return [await answer(item) for item in request.items]
+
 @api_router.post("/sessions/{session_id}/execute")
 async def execute_python_code(session_id: str, request: PythonExecutionRequest):
     """Execute Python code for statistical analysis"""
@@ -1914,108 +1865,25 @@ async def execute_python_code(session_id: str, request: PythonExecutionRequest):
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        # Decode CSV data
-        csv_data = base64.b64decode(session['file_data']).decode('utf-8')
-        df = pd.read_csv(io.StringIO(csv_data))
-        
-        # Analyze data types for commonly used variables
-        dtypes = df.dtypes.to_dict()
-        numeric_cols = [col for col, dtype in dtypes.items() if 'int' in str(dtype) or 'float' in str(dtype)]
-        categorical_cols = [col for col, dtype in dtypes.items() if 'object' in str(dtype)]
-        
-        # Prepare execution environment
-        execution_globals = {
-            'df': df,
-            'pd': pd,
-            'np': np,
-            'plt': plt,
-            'sns': sns,
-            'stats': stats,
-            'LinearRegression': LinearRegression,
-            'r2_score': r2_score,
-            'io': io,
-            'base64': base64,
-            'go': go,
-            'px': px,
-            'ff': ff,
-            'pio': pio,
-            'sm': sm,
-            'mcnemar': mcnemar,
-            # 'KaplanMeierFitter': KaplanMeierFitter,
-            # 'CoxPHFitter': CoxPHFitter,
-            # 'logrank_test': logrank_test,
-            'datetime': datetime,
-            'json': json,
-            # Add commonly used data analysis variables
-            'numeric_cols': numeric_cols,
-            'categorical_cols': categorical_cols,
-            'columns': list(df.columns)
-        }
-        
-        # Capture output
-        output_buffer = io.StringIO()
-        error_buffer = io.StringIO()
-        
+        # Run in the worker pool so long computations don't block the event loop
+        cache_key = (session['id'], session.get('file_hash') or _file_hash(session['file_data']))
         try:
-            # Redirect stdout
-            old_stdout = sys.stdout
-            sys.stdout = output_buffer
-            
-            # Execute code
-            exec(request.code, execution_globals)
-            
-            # Get output
-            output = output_buffer.getvalue()
-            
-            # Handle matplotlib plots
-            plots = []
-            if plt.get_fignums():
-                for fig_num in plt.get_fignums():
-                    fig = plt.figure(fig_num)
-                    buf = io.BytesIO()
-                    fig.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-                    buf.seek(0)
-                    plot_data = base64.b64encode(buf.read()).decode('utf-8')
-                    plots.append({
-                        'type': 'matplotlib',
-                        'data': plot_data
-                    })
-                    buf.close()
-                plt.close('all')
-            
-            # Handle Plotly plots (check for plotly figures in execution globals)
-            plotly_plots = []
-            for var_name, var_value in execution_globals.items():
-                if hasattr(var_value, '_module') and 'plotly' in str(var_value._module):
-                    try:
-                        html_str = var_value.to_html(include_plotlyjs='cdn')
-                        plotly_plots.append({
-                            'type': 'plotly',
-                            'html': html_str
-                        })
-                    except:
-                        pass
-            
-            plots.extend(plotly_plots)
-            
-            result = {
-                "success": True,
-                "output": output,
-                "plots": plots,
-                "error": None
-            }
-            
-        except Exception as e:
+            result = await execute_user_code(
+                request.code,
+                cache_key,
+                session.get('file_feather'),
+                session['file_data']
+            )
+        except BrokenProcessPool:
+            # A worker died mid-execution (e.g. killed for memory); start a fresh pool next time
+            reset_execution_pool()
             result = {
                 "success": False,
-                "output": output_buffer.getvalue(),
+                "output": "",
                 "plots": [],
-                "error": str(e)
+                "error": "Code execution worker terminated unexpectedly"
             }
         
-        finally:
-            sys.stdout = old_stdout
-        
         return result
         
     except Exception as e:
@@ -2051,9 +1919,12 @@ async def execute_sectioned_analysis(session_id: str, request: EnhancedPythonExe
         )
         
         # Store result in database
-        await db.structured_analyses.insert_one(result.dict())
+        document = result.dict()
+        await db.structured_analyses.insert_one(document)
+        document.pop('_id', None)  # added in place by insert_one
         
-        return result
+        # Returned as a ready response: the chart HTML blobs skip jsonable_encoder
+        return ORJSONResponse(document)
         
     except HTTPException:
         raise
@@ -2062,13 +1933,23 @@ async def execute_sectioned_analysis(session_id: str, request: EnhancedPythonExe
 
 @api_router.get("/sessions/{session_id}/structured-analyses")
 async def get_structured_analyses(session_id: str):
-    """Get all structured analyses for a session"""
+    """Get all structured analyses for a session (chart and table payloads are served by the detail endpoint)"""
     try:
-        analyses = await db.structured_analyses.find(
-            {"session_id": session_id}
-        ).sort("timestamp", -1).to_list(50)
+        # Strip the heavy chart/table bodies server-side; rows come straight from
+        # our own inserts, so they're returned without re-validating each one
+        cursor = db.structured_analyses.aggregate([
+            {"$match": {"session_id": session_id}},
+            {"$sort": {"timestamp": -1}},
+            {"$limit": 50},
+            {"$project": {
+                "_id": 0,
+                "sections.charts.data": 0,
+                "sections.tables.content": 0,
+                "sections.tables.data": 0
+            }}
+        ], batchSize=50)
         
-        return [StructuredAnalysisResult(**analysis) for analysis in analyses]
+        return ORJSONResponse(await cursor.to_list(50))
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2080,12 +1961,12 @@ async def get_structured_analysis(session_id: str, analysis_id: str):
         analysis = await db.structured_analyses.find_one({
             "id": analysis_id,
             "session_id": session_id
-        })
+        }, projection={"_id": 0})
         
         if not analysis:
             raise HTTPException(status_code=404, detail="Analysis not found")
         
-        return StructuredAnalysisResult(**analysis)
+        return ORJSONResponse(analysis)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2105,11 +1986,18 @@ async def suggest_analysis(session_id: str, gemini_api_key: str = Form(...)):
         columns = csv_preview.get('columns', [])
         dtypes = csv_preview.get('dtypes', {})
         shape = csv_preview.get('shape', [0, 0])
-        sample_data = csv_preview.get('head', [])
-        
-        # Analyze data structure
-        numeric_cols = [col for col, dtype in dtypes.items() if 'int' in str(dtype) or 'float' in str(dtype)]
-        categorical_cols = [col for col, dtype in dtypes.items() if 'object' in str(dtype)]
+        sample_data = csv_preview.get('head', {})
+        if isinstance(sample_data, dict):
+            # Previews are stored in 'split' orientation; rebuild row records for the prompt
+            sample_data = [dict(zip(sample_data.get('columns', []), row)) for row in sample_data.get('data', [])]
+        
+        # Column typing is stored at upload; derive it from dtypes only for older sessions
+        numeric_cols = csv_preview.get('numeric_cols')
+        categorical_cols = csv_preview.get('categorical_cols')
+        if numeric_cols is None or categorical_cols is None:
+            kinds = {col: _dtype_kind(str(dtype)) for col, dtype in dtypes.items()}
+            numeric_cols = [col for col, kind in kinds.items() if kind in 'iufc']
+            categorical_cols = [col for col, kind in kinds.items() if kind == 'O']
         
         context = f"""
         You are an Expert Biostatistician analyzing a medical research dataset.
@@ -2146,14 +2034,28 @@ async def suggest_analysis(session_id: str, gemini_api_key: str = Form(...)):
         Focus on clinically meaningful analyses that would be published in medical journals.
         """
         
+        # The prompt is built purely from the stored file, so its hash identifies the answer
+        cache_key = hashlib.sha1(f"{_SUGGESTION_MODEL}\n{context}".encode('utf-8')).hexdigest()
+        cached = await db.suggestion_cache.find_one({"key": cache_key})
+        if cached:
+            return {"suggestions": cached['response']}
+        
         chat = LlmChat(
             api_key=gemini_api_key,
             session_id=f"{session_id}_suggestions",
             system_message="You are a statistical analysis expert. Provide suggestions in JSON format."
-        ).with_model("gemini", "gemini-2.5-flash")
+        ).with_model("gemini", _SUGGESTION_MODEL)
         
         response = await chat.send_message(UserMessage(text=context))
         
+        # Only cache real answers; failures raise before reaching here
+        if isinstance(response, str) and response.strip():
+            await db.suggestion_cache.update_one(
+                {"key": cache_key},
+                {"$setOnInsert": {"key": cache_key, "response": response, "created_at": datetime.utcnow()}},
+                upsert=True
+            )
+        
         return {"suggestions": response}
         
     except Exception as e:
@@ -2185,7 +2087,7 @@ async def save_analysis_result(session_id: str, result: AnalysisResult):
     """Save analysis result to history"""
     try:
         result.session_id = session_id
-        await db.analysis_results.insert_one(result.dict())
+        await _queue_analysis_result(result.dict())
         return {"message": "Analysis saved successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2204,9 +2106,8 @@ async def get_data_preview(session_id: str, request: DataPreviewRequest):
         if not session.get('file_data'):
             raise HTTPException(status_code=400, detail="No CSV data found in session")
         
-        # Decode CSV data
-        csv_data = base64.b64decode(session['file_data']).decode('utf-8')
-        df = pd.read_csv(io.StringIO(csv_data))
+        # Load CSV data (cached per session)
+        df = _load_session_df(session)
         
         # Apply filters if provided
         if request.filters:
@@ -2270,9 +2171,8 @@ async def get_data_quality(session_id: str):
         if not session.get('file_data'):
             raise HTTPException(status_code=400, detail="No CSV data found in session")
         
-        # Decode CSV data
-        csv_data = base64.b64decode(session['file_data']).decode('utf-8')
-        df = pd.read_csv(io.StringIO(csv_data))
+        # Load CSV data (cached per session)
+        df = _load_session_df(session)
         
         # Get comprehensive quality information
         quality_info = DataCleaningService.get_data_quality_info(df)
@@ -2307,9 +2207,8 @@ async def handle_missing_data(session_id: str, request: MissingDataRequest):
         if not session.get('file_data'):
             raise HTTPException(status_code=400, detail="No CSV data found in session")
         
-        # Decode CSV data
-        csv_data = base64.b64decode(session['file_data']).decode('utf-8')
-        df = pd.read_csv(io.StringIO(csv_data))
+        # Load CSV data (cached per session)
+        df = _load_session_df(session)
         
         # Apply missing data strategy
         df_cleaned = DataCleaningService.apply_missing_data_strategy(
@@ -2351,9 +2250,8 @@ async def detect_outliers(session_id: str, request: OutlierDetectionRequest):
         if not session.get('file_data'):
             raise HTTPException(status_code=400, detail="No CSV data found in session")
         
-        # Decode CSV data
-        csv_data = base64.b64decode(session['file_data']).decode('utf-8')
-        df = pd.read_csv(io.StringIO(csv_data))
+        # Load CSV data (cached per session)
+        df = _load_session_df(session)
         
         # Detect outliers
         outliers = DataCleaningService.detect_outliers(
@@ -2391,9 +2289,8 @@ async def transform_data(session_id: str, request: DataTransformationRequest):
         if not session.get('file_data'):
             raise HTTPException(status_code=400, detail="No CSV data found in session")
         
-        # Decode CSV data
-        csv_data = base64.b64decode(session['file_data']).decode('utf-8')
-        df = pd.read_csv(io.StringIO(csv_data))
+        # Load CSV data (cached per session)
+        df = _load_session_df(session)
         
         # Apply transformation
         df_transformed = DataCleaningService.apply_data_transformation(
@@ -2435,9 +2332,8 @@ async def remove_duplicates(session_id: str, columns: List[str] = None, keep: st
         if not session.get('file_data'):
             raise HTTPException(status_code=400, detail="No CSV data found in session")
         
-        # Decode CSV data
-        csv_data = base64.b64decode(session['file_data']).decode('utf-8')
-        df = pd.read_csv(io.StringIO(csv_data))
+        # Load CSV data (cached per session)
+        df = _load_session_df(session)
         
         # Remove duplicates
         original_count = len(df)
@@ -2473,8 +2369,8 @@ async def save_cleaned_data(session_id: str, cleaned_data_b64: str, filename: st
     try:
         # Validate cleaned data
         try:
-            csv_data = base64.b64decode(cleaned_data_b64).decode('utf-8')
-            df = pd.read_csv(io.StringIO(csv_data))
+            # Parse the decoded bytes directly; no intermediate str copy
+            df = read_csv_bytes(base64.b64decode(cleaned_data_b64))
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid cleaned data format")
         
@@ -2489,18 +2385,22 @@ async def save_cleaned_data(session_id: str, cleaned_data_b64: str, filename: st
                 "columns": df.columns.tolist(),
                 "dtypes": df.dtypes.astype(str).to_dict(),
                 "null_counts": df.isnull().sum().to_dict(),
-                "sample_data": df.head(5).to_dict('records')
+                "sample_data": df.head(5).to_dict('records'),
+                "numeric_cols": df.select_dtypes(include='number').columns.tolist(),
+                "categorical_cols": df.select_dtypes(include=['object', 'category', 'string']).columns.tolist()
             }
             
+            file_fields = _session_file_fields(cleaned_data_b64, df)
             session = ChatSession(
                 id=new_session_id,
                 title=title,
                 file_name=filename,
-                file_data=cleaned_data_b64,
+                file_data=file_fields['file_data'],
+                file_hash=file_fields['file_hash'],
                 csv_preview=csv_preview
             )
             
-            await db.chat_sessions.insert_one(session.dict())
+            await db.chat_sessions.insert_one({**session.dict(), **file_fields})
             
             return {
                 "message": "Cleaned data saved as new session",
@@ -2515,16 +2415,19 @@ async def save_cleaned_data(session_id: str, cleaned_data_b64: str, filename: st
                 "columns": df.columns.tolist(),
                 "dtypes": df.dtypes.astype(str).to_dict(),
                 "null_counts": df.isnull().sum().to_dict(),
-                "sample_data": df.head(5).to_dict('records')
+                "sample_data": df.head(5).to_dict('records'),
+                "numeric_cols": df.select_dtypes(include='number').columns.tolist(),
+                "categorical_cols": df.select_dtypes(include=['object', 'category', 'string']).columns.tolist()
             }
             
             await db.chat_sessions.update_one(
                 {"id": session_id},
                 {"$set": {
-                    "file_data": cleaned_data_b64,
+                    **_session_file_fields(cleaned_data_b64, df),
                     "csv_preview": csv_preview
                 }}
             )
+            _SESSION_CACHE.pop(session_id, None)
             
             return {
                 "message": "Session updated with cleaned data",
@@ -2553,9 +2456,8 @@ async def get_variable_metadata(session_id: str):
             if not session.get("file_data"):
                 raise HTTPException(status_code=400, detail="No data file in session")
                 
-            # Load CSV data
-            csv_data = base64.b64decode(session["file_data"]).decode('utf-8')
-            df = pd.read_csv(io.StringIO(csv_data))
+            # Load CSV data (cached per session)
+            df = _load_session_df(session)
             
             # Generate default variable definitions
             variables = []
@@ -2641,9 +2543,8 @@ async def get_missing_data_suggestions(session_id: str, request: MissingSuggesti
         if not session.get("file_data"):
             raise HTTPException(status_code=400, detail="No data file in session")
         
-        # Load CSV data
-        csv_data = base64.b64decode(session["file_data"]).decode('utf-8')
-        df = pd.read_csv(io.StringIO(csv_data))
+        # Load CSV data (cached per session)
+        df = _load_session_df(session)
         
         suggestions = []
         
@@ -2710,9 +2611,8 @@ async def apply_missing_data_suggestions(session_id: str, request: ApplySuggesti
         if not session.get("file_data"):
             raise HTTPException(status_code=400, detail="No data file in session")
         
-        # Load CSV data
-        csv_data = base64.b64decode(session["file_data"]).decode('utf-8')
-        df = pd.read_csv(io.StringIO(csv_data))
+        # Load CSV data (cached per session)
+        df = _load_session_df(session)
         
         applied_changes = []
         
@@ -2743,16 +2643,19 @@ async def apply_missing_data_suggestions(session_id: str, request: ApplySuggesti
             "columns": df.columns.tolist(),
             "dtypes": df.dtypes.astype(str).to_dict(),
             "null_counts": df.isnull().sum().to_dict(),
-            "sample_data": df.head(10).to_dict('records')
+            "sample_data": df.head(10).to_dict('records'),
+            "numeric_cols": df.select_dtypes(include='number').columns.tolist(),
+            "categorical_cols": df.select_dtypes(include=['object', 'category', 'string']).columns.tolist()
         }
         
         await db.chat_sessions.update_one(
             {"id": session_id},
             {"$set": {
-                "file_data": updated_data_b64,
+                **_session_file_fields(updated_data_b64, df),
                 "csv_preview": csv_preview
             }}
         )
+        _SESSION_CACHE.pop(session_id, None)
         
         return {
             "message": "Missing data suggestions applied successfully",
@@ -2775,9 +2678,8 @@ async def edit_cell_data(session_id: str, request: CellEditRequest):
         if not session.get("file_data"):
             raise HTTPException(status_code=400, detail="No data file in session")
         
-        # Load CSV data
-        csv_data = base64.b64decode(session["file_data"]).decode('utf-8')
-        df = pd.read_csv(io.StringIO(csv_data))
+        # Load CSV data (cached per session)
+        df = _load_session_df(session)
         
         # Validate request
         if request.row_index >= len(df) or request.row_index < 0:
@@ -2802,16 +2704,19 @@ async def edit_cell_data(session_id: str, request: CellEditRequest):
             "columns": df.columns.tolist(),
             "dtypes": df.dtypes.astype(str).to_dict(),
             "null_counts": df.isnull().sum().to_dict(),
-            "sample_data": df.head(10).to_dict('records')
+            "sample_data": df.head(10).to_dict('records'),
+            "numeric_cols": df.select_dtypes(include='number').columns.tolist(),
+            "categorical_cols": df.select_dtypes(include=['object', 'category', 'string']).columns.tolist()
         }
         
         await db.chat_sessions.update_one(
             {"id": session_id},
             {"$set": {
-                "file_data": updated_data_b64,
+                **_session_file_fields(updated_data_b64, df),
                 "csv_preview": csv_preview
             }}
         )
+        _SESSION_CACHE.pop(session_id, None)
         
         return {
             "message": "Cell updated successfully",
@@ -2842,6 +2747,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+_ANALYSIS_REPORT_TEMPLATE = """# 📊 Automated Data Analysis Report
+
+I've completed an initial analysis of your dataset. Here are the key findings:
+
+{summary}
+
+You can now ask specific questions about the data or request additional analyses."""
+
 async def _create_analysis_chat_messages(session_id: str, analysis_results: dict):
     """Create automatic chat messages based on analysis results"""
     try:
@@ -2849,15 +2762,11 @@ async def _create_analysis_chat_messages(session_id: str, analysis_results: dict
         overview_message = ChatMessage(
             session_id=session_id,
             role="assistant",
-            content=f"""# 📊 Automated Data Analysis Report
-
-I've completed an initial analysis of your dataset. Here are the key findings:
-
-{analysis_results.get('summary', 'Analysis completed successfully.')}
-
-You can now ask specific questions about the data or request additional analyses."""
+            content=_ANALYSIS_REPORT_TEMPLATE.format(
+                summary=analysis_results.get('summary', 'Analysis completed successfully.')
+            )
         )
-        await db.chat_messages.insert_one(overview_message.dict())
+        documents = [overview_message.dict()]
         
         # Add detailed findings if available
         if analysis_results.get('detailed_findings'):
@@ -2866,11 +2775,53 @@ You can now ask specific questions about the data or request additional analyses
                 role="assistant",
                 content=analysis_results['detailed_findings']
             )
-            await db.chat_messages.insert_one(details_message.dict())
+            documents.append(details_message.dict())
+        
+        # One round-trip for both messages; ordered keeps the overview first
+        await db.chat_messages.insert_many(documents, ordered=True)
             
     except Exception as e:
         print(f"Error creating analysis messages: {str(e)}")
 
+@app.on_event("startup")
+async def create_db_indexes():
+    """Create the indexes backing the session, message and analysis lookups"""
+    indexes = [
+        (db.chat_sessions, 'id', {'unique': True}),
+        (db.chat_sessions, [('created_at', -1)], {}),
+        (db.chat_messages, 'id', {'unique': True}),
+        (db.chat_messages, [('session_id', 1), ('timestamp', 1)], {}),
+        (db.comprehensive_analyses, 'session_id', {'unique': True}),
+        (db.structured_analyses, 'id', {'unique': True}),
+        (db.structured_analyses, [('session_id', 1), ('timestamp', -1)], {}),
+        (db.analysis_results, [('session_id', 1), ('timestamp', -1)], {}),
+        (db.suggestion_cache, 'key', {'unique': True}),
+        (db.suggestion_cache, 'created_at', {'expireAfterSeconds': _SUGGESTION_CACHE_TTL_SECONDS}),
+    ]
+    for collection, keys, options in indexes:
+        try:
+            await collection.create_index(keys, **options)
+        except Exception as e:
+            # Existing data may violate a constraint; keep serving without that index
+            logger.warning(f"Could not create index {keys} on {collection.name}: {e}")
+
+@app.on_event("startup")
+async def start_analysis_result_writer():
+    """Start the background task that batches analysis_results inserts"""
+    global _analysis_write_queue, _analysis_writer_task
+    _analysis_write_queue = asyncio.Queue()
+    _analysis_writer_task = asyncio.create_task(_analysis_result_writer())
+
+@app.on_event("startup")
+async def start_execution_pool():
+    """Spin up the code execution workers in the background"""
+    asyncio.create_task(warm_execution_pool())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if _analysis_writer_task is not None:
+        # Let queued saves reach Mongo before the client goes away
+        await _analysis_write_queue.join()
+        _analysis_writer_task.cancel()
+    shutdown_execution_pool()
     client.close()
\ No newline at end of file
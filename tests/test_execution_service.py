@@ -0,0 +1,145 @@
+"""
+Unit tests for the code execution service: validator, output buffer, CSV parsing and pool recovery
+"""
+
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import execution_service  # noqa: E402
+from execution_service import (  # noqa: E402
+    RingStringIO,
+    SharedPayloadMissing,
+    UnsafeCodeError,
+    compile_user_code,
+    read_csv_bytes,
+)
+
+
+@pytest.mark.parametrize('code', [
+    "import subprocess",
+    "import multiprocessing.pool",
+    "from socket import socket",
+    "import os\nos.system('ls')",
+    "import os\nos.execv('/bin/sh', ['sh'])",
+    "__import__('os')",
+    "().__class__.__base__.__subclasses__()",
+    "f = lambda: 0\nf.__globals__",
+    "open('out.csv', 'w')",
+    "open('out.csv', mode='a+')",
+])
+def test_validator_rejects_unsafe_code(code):
+    with pytest.raises(UnsafeCodeError):
+        compile_user_code(code)
+
+
+def test_validator_allows_analysis_code():
+    code = "import numpy as np\nprint(df.describe())\nwith open('notes.txt') as f:\n    f.read()"
+    assert compile_user_code(code).co_filename == '<user_code>'
+
+
+def test_ring_buffer_keeps_short_output():
+    buffer = RingStringIO(limit=100)
+    buffer.write("hello\n")
+    assert buffer.getvalue() == "hello\n"
+    assert not buffer.truncated
+
+
+def test_ring_buffer_truncates_to_newest_output():
+    buffer = RingStringIO(limit=100)
+    lines = [f"line {i:03d}\n" for i in range(50)]
+    for line in lines:
+        buffer.write(line)
+
+    value = buffer.getvalue()
+    assert buffer.truncated
+    assert value.startswith(RingStringIO.TRUNCATION_MARKER)
+    assert value.endswith(lines[-1])
+    assert len(value) <= len(RingStringIO.TRUNCATION_MARKER) + 100
+    assert lines[0] not in value
+
+
+_DATED_CSV = (
+    b"patient_id,score,visit_date,admitted_at\n"
+    b"P001,1.5,2024-01-05,2024-01-05 08:30:00\n"
+    b"P002,,2024-02-11,2024-02-11 14:00:00\n"
+    b"P003,3.0,,2024-03-20 09:15:00\n"
+)
+
+
+def test_read_csv_bytes_keeps_c_engine_dtypes_for_dates():
+    pytest.importorskip('pyarrow')
+    df = read_csv_bytes(_DATED_CSV)
+
+    pd.testing.assert_frame_equal(df, pd.read_csv(io.BytesIO(_DATED_CSV)))
+    assert df['visit_date'].iloc[0] == '2024-01-05'
+    assert df['admitted_at'].dtype == object
+
+
+def test_read_csv_bytes_without_pyarrow(monkeypatch):
+    monkeypatch.setattr(execution_service, 'PYARROW_AVAILABLE', False)
+    pd.testing.assert_frame_equal(read_csv_bytes(_DATED_CSV), pd.read_csv(io.BytesIO(_DATED_CSV)))
+
+
+def test_read_shared_payload_reports_missing_block():
+    with pytest.raises(SharedPayloadMissing):
+        execution_service._read_shared_payload(('csv', 'no_such_execution_block', 10))
+
+
+def test_execute_user_code_republishes_missing_payload(monkeypatch):
+    published = []
+    attempts = []
+
+    def publish(cache_key, file_feather, file_data):
+        published.append(cache_key)
+        return ('csv', f"block_{len(published)}", 10)
+
+    def run(code, cache_key, payload):
+        attempts.append(payload)
+        if len(attempts) == 1:
+            raise SharedPayloadMissing(payload[1])
+        return {"success": True, "output": "ok", "plots": [], "error": None}
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(execution_service, '_publish_payload', publish)
+    monkeypatch.setattr(execution_service, 'run_user_code', run)
+    monkeypatch.setattr(execution_service, 'get_execution_pool', lambda: executor)
+    try:
+        result = asyncio.run(execution_service.execute_user_code("print('ok')", ('s1', 'h1'), None, ''))
+    finally:
+        executor.shutdown()
+
+    assert result["success"]
+    assert published == [('s1', 'h1'), ('s1', 'h1')]
+    assert [payload[1] for payload in attempts] == ['block_1', 'block_2']
+
+
+class _RecordingPool:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.shutdown_calls = []
+
+    def shutdown(self, **kwargs):
+        self.shutdown_calls.append(kwargs)
+
+
+def test_reset_execution_pool_replaces_broken_pool(monkeypatch):
+    broken = _RecordingPool()
+    monkeypatch.setattr(execution_service, '_pool', broken)
+    monkeypatch.setattr(execution_service, 'ProcessPoolExecutor', _RecordingPool)
+    monkeypatch.setattr(execution_service, '_mp_context', lambda: None)
+
+    execution_service.reset_execution_pool()
+
+    assert broken.shutdown_calls == [{'wait': False, 'cancel_futures': True}]
+    assert execution_service._pool is None
+    fresh = execution_service.get_execution_pool()
+    assert fresh is not broken
+    assert fresh is execution_service.get_execution_pool()